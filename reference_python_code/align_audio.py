@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import argparse
+from multiprocessing import Pool
+
+import numpy as np
+from pydub import AudioSegment
+
+from km_text import BASE_DIR, split_by_period, strip_diacritics
+
+# analysis window for the energy curve
+FRAME_MS = 20
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Align sentences with their recordings")
+    parser.add_argument("--resources", type=str, default=f"{BASE_DIR}/assets/resources.json", help="Directory where the data is stored")
+    parser.add_argument("--mojam", type=str, default="لسان العرب", help="Dictionary to align")
+    parser.add_argument("--audio", type=str, default=f"{BASE_DIR}/audio/processed", help="Directory with <root>.mp3 files")
+    parser.add_argument("--output", type=str, default=f"{BASE_DIR}/audio/alignment.json", help="Where to save the index")
+    parser.add_argument("--silence_thresh", type=float, default=-35.0, help="Silence level in dB below the loudest frame")
+    parser.add_argument("--min_silence", type=int, default=250, help="Shortest pause in ms that can end a sentence")
+    parser.add_argument("--max_shift", type=int, default=1500, help="How far in ms a boundary may move to reach a pause")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of parallel workers")
+    return parser.parse_args()
+
+def frame_energy(audio):
+    """Returns the energy of every frame in dB relative to the loudest frame."""
+    samples = np.array(audio.set_channels(1).get_array_of_samples(), dtype=np.float32)
+    frame_len = int(audio.frame_rate * FRAME_MS / 1000)
+    n_frames = len(samples) // frame_len
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = samples[:n_frames * frame_len].reshape(n_frames, frame_len)
+    rms = np.sqrt(np.mean(frames ** 2, axis=1)) + 1e-9
+    return 20 * np.log10(rms / rms.max())
+
+def find_pauses(energy, silence_thresh, min_silence):
+    """Returns the start and end in ms of every pause at least min_silence long."""
+    silent = np.concatenate(([False], energy < silence_thresh, [False])).astype(np.int8)
+    edges = np.diff(silent)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    keep = (ends - starts) * FRAME_MS >= min_silence
+    return starts[keep] * FRAME_MS, ends[keep] * FRAME_MS
+
+def align_sentences(sentences, length_ms, pause_starts, pause_ends, max_shift):
+    """
+    Returns n+1 boundaries in ms for n sentences.
+
+    Each sentence gets a share of the speech proportional to its letters,
+    then every inner boundary is moved to the middle of the nearest pause.
+    """
+    # skip silence before the first word and after the last one
+    start, end = 0, length_ms
+    if len(pause_starts) and pause_starts[0] == 0:
+        start = pause_ends[0]
+        pause_starts, pause_ends = pause_starts[1:], pause_ends[1:]
+    if len(pause_ends) and pause_ends[-1] >= length_ms:
+        end = pause_starts[-1]
+        pause_starts, pause_ends = pause_starts[:-1], pause_ends[:-1]
+    if end <= start:
+        start, end = 0, length_ms
+
+    letters = np.array([max(1, len(strip_diacritics(s).replace(" ", ""))) for s in sentences], dtype=np.float64)
+    boundaries = start + np.concatenate(([0], np.cumsum(letters) / letters.sum())) * (end - start)
+
+    if len(pause_starts) and len(sentences) > 1:
+        middles = (pause_starts + pause_ends) / 2
+        inner = boundaries[1:-1]
+        distance = np.abs(middles[None, :] - inner[:, None])
+        nearest = distance.argmin(axis=1)
+        close = distance[np.arange(len(inner)), nearest] <= max_shift
+        boundaries[1:-1] = np.where(close, middles[nearest], inner)
+        # two boundaries can snap to the same pause, keep them in order
+        boundaries = np.maximum.accumulate(boundaries)
+
+    return [int(round(b)) for b in boundaries]
+
+def align_root(job):
+    """Returns (root, boundaries, error), one bad recording must not stop the run."""
+    root, context, file_path, silence_thresh, min_silence, max_shift = job
+    sentences = split_by_period(context)
+    if len(sentences) == 0:
+        return root, None, "no sentences"
+    try:
+        audio = AudioSegment.from_file(file_path, format="mp3")
+        energy = frame_energy(audio)
+        pause_starts, pause_ends = find_pauses(energy, silence_thresh, min_silence)
+        return root, align_sentences(sentences, len(energy) * FRAME_MS, pause_starts, pause_ends, max_shift), None
+    except Exception as e:
+        return root, None, f"{type(e).__name__}: {e}"
+
+def main():
+    args = parse_args()
+    with open(args.resources) as f:
+        resources = json.load(f)[args.mojam]
+
+    jobs = []
+    for root, context in resources.items():
+        file_path = os.path.join(args.audio, f"{root}.mp3")
+        if os.path.exists(file_path):
+            jobs.append((root, context, file_path, args.silence_thresh, args.min_silence, args.max_shift))
+
+    start_time = time.time()
+    alignment = {}
+    skipped = {}
+    with Pool(args.workers) as pool:
+        for root, boundaries, error in pool.imap_unordered(align_root, jobs, chunksize=8):
+            if boundaries is not None:
+                alignment[root] = boundaries
+            else:
+                skipped[root] = error
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(alignment, f, ensure_ascii=False, separators=(",", ":"))
+    print(f"Aligned {len(alignment)}/{len(jobs)} roots in {time.time() - start_time:.1f}s -> {args.output}")
+    if skipped:
+        print(f"Skipped {len(skipped)} roots:")
+        for root, error in sorted(skipped.items()):
+            print(f"  {root}: {error}")
+
+if __name__ == '__main__':
+    main()
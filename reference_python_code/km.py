@@ -5,7 +5,7 @@ from PyQt5 import uic
 from PyQt5 import QtWidgets
 
 from PyQt5.QtWidgets import QTextEdit
-from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtCore import Qt, pyqtSignal, QItemSelectionModel
 from PyQt5.QtWidgets import QStyledItemDelegate
 from PyQt5.QtGui import QBrush, QColor,QTextCursor,QMouseEvent
 
@@ -17,68 +17,20 @@ import json
 import signal
 import string
 import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from pydub import AudioSegment
 import simpleaudio as sa
 
+from km_text import (ARABIC_PUNCTUATION, get_words, highlight_conjugations, split_by_period,
+                     strip_prefix, unique)
+from pcm_store import PcmStore
+
 def change_playback_speed(sound, speed=1.0):
     new_frame_rate = int(sound.frame_rate * speed)
     sound_with_new_frame_rate = sound._spawn(sound.raw_data, overrides={'frame_rate': new_frame_rate})
     return sound_with_new_frame_rate.set_frame_rate(sound.frame_rate)
-import re
-
-# All Arabic combining marks (tashkīl)
-DIACRITICS = r'\u0610-\u061A\u064B-\u0652\u06D6-\u06ED'
-
-# After each letter in your core word, we allow *any* number of diacritics
-COMBINING = rf'[{DIACRITICS}]*'
-
-# Define what our “word‐character” is, so our lookarounds treat diacritics as inside‐the‐word
-WORD_CHAR = rf'[\w{DIACRITICS}]'
-
-# The prefixes we’ll accept in front of your core – but never color unless
-# that prefix is actually part of your conjugation entry.
-_PREFIXES = ["لل", "و", "ب", "ل", "ف", "ك"]
-
-def strip_diacritics(s: str) -> str:
-    """Remove any tashkīl from your conjugation entry."""
-    return re.sub(rf'[{DIACRITICS}]', '', s)
-
-def highlight_conjugations(text: str, conjugations: list[str]) -> str:
-    # Sort longest→shortest so “كتاب” wins over “كتب”
-    for conj in sorted(conjugations, key=len, reverse=True):
-        # 1) Strip any diacritics the user provided, we’ll re‐allow them in matching
-        core_plain = strip_diacritics(conj)
-        if not core_plain:
-            continue
-
-        # 2) Build a diacritic‐tolerant regex for that core word
-        #    e.g. if core_plain = "به", this becomes "ب[ـ]*ه[ـ]*"
-        escaped = ''.join(re.escape(ch) + COMBINING for ch in core_plain)
-
-        # 3) Build a single regex with:
-        #    - custom "no word‐char" lookaround before
-        #    - an optional prefix group (we won't color this)
-        #    - the core group (we *will* color this)
-        #    - custom lookahead after
-        prefix_alt = '|'.join(re.escape(p) for p in _PREFIXES)
-        pattern = re.compile(
-            rf'(?<!{WORD_CHAR})'             # not preceded by letter/digit/underscore/diacritic
-            rf'(?P<prefix>(?:{prefix_alt}))?' # optional one of our prefixes
-            rf'(?P<core>{escaped})'           # the core word, with diacritics allowed
-            rf'(?!{WORD_CHAR})',              # not followed by letter/digit/underscore/diacritic
-            flags=re.UNICODE
-        )
-
-        # 4) Replace each match by re-inserting prefix un‐touched, coloring only core
-        def _repl(m):
-            pre  = m.group('prefix') or ''
-            cor  = m.group('core')
-            return f"{pre}<span style='color:#66d855'>{cor}</span>"
-
-        text = pattern.sub(_repl, text)
-
-    return text
 
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -102,47 +54,151 @@ def parse_args():
     parser.add_argument("--resources", type=str, default=f"{BASE_DIR}/assets/resources.json", help="Directory where the data is stored")
     parser.add_argument("--dataset", type=str, default=f"{BASE_DIR}/assets/dataset.json", help="Where to save the data")
     parser.add_argument("--ai", type=str, default=f"{BASE_DIR}/assets/spectrum.json", help="AI provider")
+    parser.add_argument("--alignment", type=str, default=f"{BASE_DIR}/audio/alignment.json", help="Sentence timings made by align_audio.py")
+    parser.add_argument("--pcm_store", type=str, default=f"{BASE_DIR}/audio/processed.pcm", help="PCM store made by transcode_audio.py")
+    parser.add_argument("--prefetch", type=int, default=5, help="Number of upcoming roots to precompute in the background")
 
     return parser.parse_args()
 
 
-ARABIC_PUNCTUATION = '،:؟؛«»'
-
 QUi_KM, Ui_Ui_KM = uic.loadUiType(f"{BASE_DIR}/assets/km.ui", resource_suffix='')
 
 signal.signal(signal.SIGINT, signal.SIG_DFL)
 
-def split_by_period(text):
+HTML_TEXT = """
+            <html dir="rtl">
+            <div style=" word-wrap: normal;line-height: 40px;font-size: 24px; margin-right: 20px">
+            {}</div>
+            </html>"""
+
+def render_root(context, words, ai_context):
     """
-    Splits text by periods except those within parentheses.
-    
-    Args:
-        text (str): Input text to be split
-        
+    Builds the html shown for a root.
+
     Returns:
-        list: List of sentences, with whitespace stripped
+        tuple: (highlighted text, context html, ai html)
     """
-    results = []
-    current_sentence = ""
-    paren_count = 0
-    
-    for char in text:
-        current_sentence += char
-        
-        if char == '(':
-            paren_count += 1
-        elif char == ')':
-            paren_count = max(0, paren_count - 1)  # Prevent negative count
-        elif char == '.' and paren_count == 0:
-            # Only split if we're not inside parentheses
-            results.append(current_sentence.strip())
-            current_sentence = ""
-            
-    # Add the last sentence if it doesn't end with a period
-    if current_sentence.strip():
-        results.append(current_sentence.strip())
-        
-    return results
+    # sort from longer to shorter
+    conjugations = sorted(words,key=lambda x: len(x),reverse=True)
+
+    text = highlight_conjugations(context,conjugations)
+    context_html_text = HTML_TEXT.format("<br/><br/>".join(split_by_period(text)))
+    context_html_text = context_html_text.format(text)
+
+    ai_context_html_text = HTML_TEXT.format("<br/><br/>".join(ai_context.split(".")))
+    ai_context_html_text = ai_context_html_text.format(ai_context)
+    return text, context_html_text, ai_context_html_text
+
+def precompute_root(context, root, saved_words, ai_context):
+    """
+    Runs everything a root switch needs: the word list (unless the root
+    already has saved words) and the rendered html.
+    """
+    if saved_words is None:
+        words = get_words(context, root)
+    else:
+        words = list(saved_words)
+    text, context_html_text, ai_context_html_text = render_root(context, words, ai_context)
+    return {
+        "words": words,
+        "text": text,
+        "context_html": context_html_text,
+        "ai_html": ai_context_html_text,
+    }
+
+class RootPrecomputer:
+    """
+    Precomputes the next roots of the current ordering on a worker thread.
+
+    Every entry remembers the saved words it was built from, so an entry is
+    only handed out while mojam_data still holds the same words for that root.
+    """
+    def __init__(self, ahead=5):
+        self.ahead = ahead
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.lock = threading.Lock()
+        self.entries = {}  # root -> (saved words snapshot, future)
+
+    def schedule(self, roots, idx, resources, mojam_data, ai_data):
+        """Keep the roots after idx precomputed, nearest first."""
+        if self.ahead <= 0:
+            return
+        upcoming = roots[idx + 1:idx + 1 + self.ahead]
+        with self.lock:
+            # drop whatever left the window (sort change, jump, ...)
+            for root in list(self.entries):
+                if root not in upcoming:
+                    self.entries.pop(root)[1].cancel()
+            for root in upcoming:
+                saved_words = saved_snapshot(mojam_data, root)
+                entry = self.entries.get(root)
+                if entry is not None and entry[0] == saved_words:
+                    continue
+                if entry is not None:
+                    entry[1].cancel()
+                future = self.executor.submit(precompute_root, resources[root], root,
+                                              saved_words, ai_data.get(root, ""))
+                self.entries[root] = (saved_words, future)
+
+    def take(self, root, mojam_data):
+        """Returns the precomputed result for root if it is ready and still valid."""
+        with self.lock:
+            entry = self.entries.pop(root, None)
+        if entry is None:
+            return None
+        saved_words, future = entry
+        if saved_words != saved_snapshot(mojam_data, root):
+            future.cancel()
+            return None
+        # still queued: cheaper to compute it right away than to wait
+        if future.cancel():
+            return None
+        try:
+            return future.result()
+        except Exception:
+            return None
+
+    def invalidate(self):
+        with self.lock:
+            for _, future in self.entries.values():
+                future.cancel()
+            self.entries = {}
+
+    def shutdown(self):
+        self.invalidate()
+        self.executor.shutdown(wait=False)
+
+def saved_snapshot(mojam_data, root):
+    # copy the words, the list in mojam_data is edited in place
+    if root in mojam_data:
+        return tuple(mojam_data[root])
+    return None
+
+def seek_position(plain_text, position, sentences, boundaries):
+    """
+    Maps a character position in the displayed text to milliseconds in the
+    recording, using the sentence boundaries from align_audio.py. Inside a
+    sentence the time is interpolated by character offset.
+    """
+    if len(boundaries) != len(sentences) + 1:
+        # the entry changed since it was aligned
+        return None
+    offset = 0
+    for i, sentence in enumerate(sentences):
+        # the html view collapses whitespace
+        sentence = " ".join(sentence.split())
+        start = plain_text.find(sentence, offset)
+        if start < 0:
+            return None
+        end = start + len(sentence)
+        if position < start:
+            return boundaries[i]
+        if position <= end:
+            ratio = (position - start) / max(1, len(sentence))
+            return int(boundaries[i] + ratio * (boundaries[i + 1] - boundaries[i]))
+        offset = end
+    # after the last sentence, e.g. trailing whitespace
+    return boundaries[-1]
 
 class ColorDelegate(QStyledItemDelegate):
     def __init__(self, roots, data, parent=None):
@@ -177,6 +233,7 @@ class ColorDelegate(QStyledItemDelegate):
 
 class ClickableLabel(QTextEdit):
     wordClicked = pyqtSignal(str)
+    positionClicked = pyqtSignal(int)
     def __init__(self, parent=None):
         super().__init__(parent)
         self.words = []  # List of words to display
@@ -192,7 +249,10 @@ class ClickableLabel(QTextEdit):
 
     def mousePressEvent(self, event):
         if event.button() == Qt.LeftButton:
-            if self.word:
+            # ctrl+click seeks the recording instead of toggling the word
+            if event.modifiers() & Qt.ControlModifier:
+                self.positionClicked.emit(self.cursorForPosition(event.pos()).position())
+            elif self.word:
                 self.wordClicked.emit(self.word)  # Emit the word clicked
 
     def mouseMoveEvent(self, mouse_event: QMouseEvent) -> None:
@@ -208,9 +268,52 @@ class ClickableLabel(QTextEdit):
 
 
 
-def unique(sequence):
-    seen = set()
-    return [x for x in sequence if not (x in seen or seen.add(x))]
+HARAKAT = "َُِ" + "ًٌٍ"
+
+# word edits used by the batch operations, each takes the word and its root
+# and returns the new word or None to delete it
+def add_prefix(prefix):
+    def _add(word, root):
+        return prefix + word
+    return _add
+
+def remove_prefix(word, root):
+    # same rule as get_words and handle_word_click
+    if len(word) > 1:
+        stripped = strip_prefix(word, root)
+        if stripped != word:
+            # the prefix's haraka goes with it
+            return stripped.lstrip(HARAKAT)
+    return word
+
+def set_haraka(haraka):
+    def _set(word, root):
+        if not word:
+            return word
+        # replace whatever haraka the first letter already has
+        return word[0] + haraka + word[1:].lstrip(HARAKAT)
+    return _set
+
+def delete_word(word, root):
+    return None
+
+def apply_edit(words, rows, edit, root):
+    """
+    Returns the edited words, without duplicates like get_words, and the rows
+    the edited words end up at.
+    """
+    rows = set(rows)
+    edited = []
+    changed = []
+    for i, word in enumerate(words):
+        if i in rows:
+            word = edit(word, root)
+            if word is not None:
+                changed.append(word)
+        if word is not None:
+            edited.append(word)
+    edited = unique(edited)
+    return edited, sorted(set(edited.index(word) for word in changed))
 
 class Ui_KM(QUi_KM, Ui_Ui_KM):
     def __init__(self, resources_file,dataset_file,mojam,parent=None):
@@ -227,6 +330,8 @@ class Ui_KM(QUi_KM, Ui_Ui_KM):
         #self.lbl_source.setFont(font)
 
         self.lbl_source.wordClicked.connect(self.handle_word_click)
+        self.lbl_source.positionClicked.connect(self.handle_position_click)
+        self.txt_root_filter.textChanged.connect(self.on_root_filter_changed)
         self.lbl_source.setTextInteractionFlags(Qt.TextSelectableByMouse)
         self.sorted = False
         self.from_save = False
@@ -235,6 +340,9 @@ class Ui_KM(QUi_KM, Ui_Ui_KM):
         self.mojam = mojam
         self.dataset_file = dataset_file
         self.current_words = []
+        # each entry is one batch: a list of (root, words before, words after)
+        self.undo_stack = []
+        self.redo_stack = []
 
         # load resources
         with open(resources_file) as f:
@@ -243,6 +351,19 @@ class Ui_KM(QUi_KM, Ui_Ui_KM):
         # load ai data
         with open(args.ai) as f:
             self.ai_data = json.load(f)
+
+        # sentence timings, optional
+        self.alignment = {}
+        if os.path.exists(args.alignment):
+            with open(args.alignment) as f:
+                self.alignment = json.load(f)
+        # decoded audio, optional
+        self.pcm_store = None
+        if os.path.exists(args.pcm_store) and os.path.exists(args.pcm_store + ".json"):
+            self.pcm_store = PcmStore(args.pcm_store)
+        self.play_obj = None
+        self.current_raw = None
+        self.audio_key = None
     
         if os.path.exists(dataset_file):
             with open(dataset_file) as f:
@@ -257,6 +378,7 @@ class Ui_KM(QUi_KM, Ui_Ui_KM):
         
         self.roots = list(self.resources[self.mojam].keys())
         self.current_roots = self.roots
+        self.precomputer = RootPrecomputer(args.prefetch)
 
         self._populate_list_view()
         # add signal to list of words index changed
@@ -289,20 +411,34 @@ class Ui_KM(QUi_KM, Ui_Ui_KM):
         idx = item.row()
         
         self.current_idx = idx
-        self._populate_ls_words(idx)
+        ready = self.precomputer.take(self.current_roots[idx], self.mojam_data)
+        self._populate_ls_words(idx, ready)
         n_answer = len(self.mojam_data)
         self.lbl_completed.setText(f"Completed: {n_answer}/{len(self.resources[self.mojam])}")
-        self._populate_text_view(self.current_idx)
+        self._populate_text_view(self.current_idx, ready)
         # push scroller to the top
         self.lbl_source.verticalScrollBar().setValue(0)
         self.scrollArea2.verticalScrollBar().setValue(0)
-
-    def _populate_ls_words(self,idx):
+        # get the next roots ready while the user works on this one
+        self._schedule_precompute()
+
+    def _schedule_precompute(self):
+        # follow what the user sees: the filter hides rows of ls_roots
+        visible = [i for i in range(len(self.current_roots)) if not self.ls_roots.isRowHidden(i)]
+        roots = [self.current_roots[i] for i in visible]
+        # the current root may be hidden itself, continue after it either way
+        idx = sum(1 for i in visible if i <= self.current_idx) - 1
+        self.precomputer.schedule(roots, idx,
+                                  self.resources[self.mojam], self.mojam_data, self.ai_data)
+
+    def _populate_ls_words(self,idx,ready=None):
         # get root
         root = self.current_roots[idx]
         context = self.resources[self.mojam][root]
         if root in self.mojam_data:
             self.current_words = self.mojam_data[root]
+        elif ready is not None:
+            self.current_words = list(ready["words"])
         else: 
             print(root)
             self.current_words = self.get_words(context)
@@ -330,37 +466,25 @@ class Ui_KM(QUi_KM, Ui_Ui_KM):
 
         vsb.setValue(round(old_pos_ratio * vsb.maximum()))
     
-    def _populate_text_view(self, itemidx):
+    def _populate_text_view(self, itemidx, ready=None):
         root = self.current_roots[itemidx]
         context = self.resources[self.mojam][root]
         if root in self.ai_data:
             ai_context = self.ai_data[root]
         else:
             ai_context = ""
-        # # right to left
         
-        html_text = """
-            <html dir="rtl">
-            <div style=" word-wrap: normal;line-height: 40px;font-size: 24px; margin-right: 20px">
-            {}</div>
-            </html>"""
-        
-        text = context
-        conjugations = self.current_words
-        # sort from longer to shorter
-        conjugations = sorted(conjugations,key=lambda x: len(x),reverse=True)
-
-        text = highlight_conjugations(text,conjugations)    
-        context_html_text = html_text.format("<br/><br/>".join(split_by_period(text)))
-        
-        context_html_text = context_html_text.format(text)
+        # reuse the background result only if it was built from the same words
+        if ready is not None and ready["words"] == list(self.current_words):
+            text = ready["text"]
+            context_html_text = ready["context_html"]
+            ai_context_html_text = ready["ai_html"]
+        else:
+            text, context_html_text, ai_context_html_text = render_root(context, self.current_words, ai_context)
 
-        
         self.full_preserve(context_html_text)
         self.lbl_source.update_data(text,self.current_words)
 
-        ai_context_html_text = html_text.format("<br/><br/>".join(ai_context.split(".")))
-        ai_context_html_text = ai_context_html_text.format(ai_context)
         self.lbl_ai.setText(ai_context_html_text)
         
     def handle_word_click(self, w):
@@ -371,21 +495,11 @@ class Ui_KM(QUi_KM, Ui_Ui_KM):
         # current root
         root = self.current_roots[self.current_idx]
         w  = w.translate(str.maketrans('', '', string.punctuation+ ARABIC_PUNCTUATION))
-        if w.startswith("ك") and not root.startswith("ك"):
-                w = w[1:]
-        elif w.startswith("ب") and not root.startswith("ب"):
-            w = w[1:]
-        elif w.startswith("ل") and not root.startswith("ل"):
-            w = w[1:]
-        elif w.startswith("ف") and not root.startswith("ف"):
-            w = w[1:]
-        elif w.startswith("و") and not root.startswith("و"):
-            w = w[1:]
-        elif w.startswith("وو") and root.startswith("و"):
-            w = w[1:]
+        w = strip_prefix(w, root)
         # check if word starts with haraka or not
         if w.startswith("َ") or w.startswith("ُ") or w.startswith("ِ") or w.startswith("ً") or w.startswith("ٌ") or w.startswith("ٍ"):
             w = w[1:]
+        before = list(self.current_words)
         if w in self.current_words:
             print("deleting",w)
             # remove the word from the list
@@ -393,6 +507,9 @@ class Ui_KM(QUi_KM, Ui_Ui_KM):
         else:
             # add the word to the list
             self.current_words.append(w)
+        # clicks are undoable like the batch edits
+        self.undo_stack.append([(root, before, list(self.current_words))])
+        self.redo_stack = []
 
         # update the list view
         self.ls_words.clear()
@@ -404,104 +521,87 @@ class Ui_KM(QUi_KM, Ui_Ui_KM):
         # select the last word
         self.ls_words.setCurrentRow(len(self.current_words) - 1)
 
-    def get_words(self,context):
-        similar_words = []
-        root = self.current_roots[self.current_idx]
-        root = root.replace("أ","ء").replace("ئ","ء").replace("ؤ","ء").replace("إ","ء")
-        root_no_tashkeel = "".join([c for c in root if c.isalpha()])
-        # if root ends with 2 same letters, find that letter
-        if root[-1] == root[-2]:
-            shaddah_letter = root[-1]
-        else:
-            shaddah_letter = None
-        for act_word in context.split():
-            act_word = act_word.translate(str.maketrans('', '', string.punctuation+ARABIC_PUNCTUATION))
-            w_no_tashkeel = "".join([c for c in act_word if c.isalpha()])
-            w_no_tashkeel = w_no_tashkeel.replace("أ","ء").replace("ئ","ء").replace("ؤ","ء").replace("إ","ء")
-            w_no_tashkeel = w_no_tashkeel.replace("ا","ايو").replace("ي","ايو").replace("و","ايو")
-            if shaddah_letter:
-                w_no_tashkeel = w_no_tashkeel.replace(shaddah_letter,shaddah_letter+shaddah_letter)
-                
-            i = 0
-            j = 0
-            good = False
-            while i < len(root_no_tashkeel) and j < len(w_no_tashkeel):
-
-                if root_no_tashkeel[i] == 'ا':
-                    i += 1
-                elif root_no_tashkeel[i] == w_no_tashkeel[j]:
-                    i += 1
-                    j += 1
-                else:
-                    j += 1
-                if i == len(root_no_tashkeel):
-                    good = True
-                    break
-            if good:
-                similar_words.append(act_word)
-                # if not root.startswith("ول") and w_no_tashkeel.startswith("وال"):
-                #     w_no_tashkeel = w_no_tashkeel[3:]
-                # elif w_no_tashkeel.startswith("ال"):
-                #     w_no_tashkeel = w_no_tashkeel[2:]
-                # elif root[0] != "و" and w_no_tashkeel.startswith("و"):
-                #     w_no_tashkeel = w_no_tashkeel[1:]
-        
-     
-        
-        # remove ك ب ل ف from the begginging if the root doesn't start with either
-        for i,w in enumerate(similar_words):
-            if w.startswith("ك") and not root.startswith("ك"):
-                w = w[1:]
-            elif w.startswith("ب") and not root.startswith("ب"):
-                w = w[1:]
-            elif w.startswith("ل") and not root.startswith("ل"):
-                w = w[1:]
-            elif w.startswith("ف") and not root.startswith("ف"):
-                w = w[1:]
-            elif w.startswith("و") and not root.startswith("و"):
-                w = w[1:]
-            elif w.startswith("وو") and root.startswith("و"):
-                w = w[1:]
-            similar_words[i] = w
-            # check if word starts with haraka or not
-            if w.startswith("َ") or w.startswith("ُ") or w.startswith("ِ") or w.startswith("ً") or w.startswith("ٌ") or w.startswith("ٍ"):
-                w = w[1:]
-                similar_words[i] = w
-                
-        return unique(similar_words)
+    def get_words(self,context,root=None):
+        if root is None:
+            root = self.current_roots[self.current_idx]
+        return get_words(context,root)
     
     def on_pb_save_clicked(self):
         with open(self.dataset_file,"w",encoding="utf-8") as f:
             json.dump(self.data,f,ensure_ascii=False,indent=4)
     
     def on_pb_play_released(self):
+        self._play_from(0)
+
+    def _play_from(self, start_ms):
         root = self.current_roots[self.current_idx]
-        file_path = os.path.join(BASE_DIR, "audio/processed", f"{root}.mp3")
-        if os.path.exists(file_path):
-            audio = AudioSegment.from_file(file_path, format="mp3")
+        # Apply playback speed change from, for example, a text field:
+        speed_factor = float(self.txt_playspeed.toPlainText())
 
-            # Apply playback speed change from, for example, a text field:
-            speed_factor = float(self.txt_playspeed.toPlainText())
-            processed_audio = change_playback_speed(audio, speed=speed_factor)
-
-            # Save audio and parameters for pause/resume handling
-            self.current_audio = processed_audio
-            self.current_params = {
-                'num_channels': processed_audio.channels,
-                'bytes_per_sample': processed_audio.sample_width,
-                'sample_rate': processed_audio.frame_rate
-            }
-            self.current_raw = processed_audio.raw_data
-
-            # Start playback from the beginning
-            self.play_obj = sa.play_buffer(self.current_raw,
-                                           self.current_params['num_channels'],
-                                           self.current_params['bytes_per_sample'],
-                                           self.current_params['sample_rate'])
-            self.start_time = time.time()
-            self.pause_time = None
+        # load again only if the root or the speed changed
+        if self.audio_key != (root, speed_factor):
+            if not self._load_audio(root, speed_factor):
+                return
+            self.audio_key = (root, speed_factor)
+
+        # positions are in the original recording, the processed one is faster or slower
+        offset = start_ms / 1000 / speed_factor
+        self.play_obj = sa.play_buffer(self._raw_from(offset),
+                                       self.current_params['num_channels'],
+                                       self.current_params['bytes_per_sample'],
+                                       self.current_params['sample_rate'])
+        self.start_time = time.time() - offset
+        self.pause_time = None
+
+    def _load_audio(self, root, speed_factor):
+        """Sets current_raw and current_params for root, from the pcm store when possible."""
+        if self.pcm_store is not None and root in self.pcm_store:
+            data = self.pcm_store.get(root)
+            params = self.pcm_store.params(root)
+            if speed_factor == 1.0:
+                # play straight from the mapped file
+                self.current_raw = data
+                self.current_params = params
+                return True
+            audio = AudioSegment(data=bytes(data),
+                                 sample_width=params['bytes_per_sample'],
+                                 frame_rate=params['sample_rate'],
+                                 channels=params['num_channels'])
         else:
-            print(f"File {file_path} does not exist.")
+            file_path = os.path.join(BASE_DIR, "audio/processed", f"{root}.mp3")
+            if not os.path.exists(file_path):
+                print(f"File {file_path} does not exist.")
+                return False
+            audio = AudioSegment.from_file(file_path, format="mp3")
+
+        processed_audio = change_playback_speed(audio, speed=speed_factor)
+
+        # Save audio and parameters for pause/resume handling
+        self.current_params = {
+            'num_channels': processed_audio.channels,
+            'bytes_per_sample': processed_audio.sample_width,
+            'sample_rate': processed_audio.frame_rate
+        }
+        self.current_raw = processed_audio.raw_data
+        return True
+
+    def _raw_from(self, seconds):
+        # cut on a frame boundary so channels and sample bytes stay aligned
+        frame_size = self.current_params['num_channels'] * self.current_params['bytes_per_sample']
+        return self.current_raw[int(seconds * self.current_params['sample_rate']) * frame_size:]
+
+    def handle_position_click(self, position):
+        root = self.current_roots[self.current_idx]
+        if root not in self.alignment:
+            print(f"No alignment for {root}.")
+            return
+        sentences = split_by_period(self.resources[self.mojam][root])
+        start_ms = seek_position(self.lbl_source.toPlainText(), position, sentences, self.alignment[root])
+        if start_ms is None:
+            print(f"Alignment for {root} does not match the text.")
+            return
+        self.on_pb_stop_released()
+        self._play_from(start_ms)
 
     def on_pb_pause_released(self):
         if self.play_obj is not None:
@@ -519,14 +619,9 @@ class Ui_KM(QUi_KM, Ui_Ui_KM):
             print(f"Paused at {elapsed} seconds.")
 
     def on_pb_resume_released(self):
-        if self.current_audio is not None and self.pause_time is not None:
-            # Calculate the starting point in milliseconds
-            start_ms = int(self.pause_time * 1000)
-            remaining_audio = self.current_audio[start_ms:]
-            raw_data = remaining_audio.raw_data
-
+        if self.current_raw is not None and self.pause_time is not None:
             # Resume playback from the saved position
-            self.play_obj = sa.play_buffer(raw_data,
+            self.play_obj = sa.play_buffer(self._raw_from(self.pause_time),
                                            self.current_params['num_channels'],
                                            self.current_params['bytes_per_sample'],
                                            self.current_params['sample_rate'])
@@ -543,149 +638,144 @@ class Ui_KM(QUi_KM, Ui_Ui_KM):
             self.pause_time = None
             print("Stopped playback.")
 
-    def on_pb_delete_released(self):
-        # get selected word from the list if any
-        item = self.ls_words.selectedIndexes()
-        if len(item) == 0:
+    def _words_for(self, root):
+        # the current root may not be in mojam_data until it is saved
+        if root == self.current_roots[self.current_idx]:
+            return self.current_words
+        return self.mojam_data.get(root)
+
+    def _batch_targets(self):
+        """
+        Returns {root: rows} for the next edit: the selected words of the
+        current root, plus the same words in every root shown by the filter
+        when ck_all_roots is checked.
+        """
+        rows = sorted(index.row() for index in self.ls_words.selectedIndexes())
+        if len(rows) == 0:
+            return {}
+        root = self.current_roots[self.current_idx]
+        targets = {root: rows}
+        if self.ck_all_roots.isChecked():
+            if not self.txt_root_filter.text().strip():
+                # never rewrite the whole dictionary by accident
+                print("Type a root filter to edit other roots.")
+                return targets
+            selected = set(self.current_words[i] for i in rows)
+            for other in self.current_roots:
+                if other == root or other not in self.mojam_data or not self._root_matches(other):
+                    continue
+                other_rows = [i for i, w in enumerate(self.mojam_data[other]) if w in selected]
+                if other_rows:
+                    targets[other] = other_rows
+        return targets
+
+    def _root_matches(self, root):
+        return self.txt_root_filter.text().strip() in root
+
+    def on_root_filter_changed(self):
+        # hide the roots a filtered batch would not touch
+        for i, root in enumerate(self.current_roots):
+            self.ls_roots.setRowHidden(i, not self._root_matches(root))
+        self._schedule_precompute()
+
+    def _apply_batch(self, edit):
+        """Applies edit to every target word as one undoable transaction."""
+        targets = self._batch_targets()
+        if len(targets) == 0:
             return
-        idx = item[0].row()
-        # remove the word from the list
-        self.current_words.pop(idx)
-        # update the list view
-        self._populate_ls_words(self.current_idx)
-        # update the text view
+        batch = []
+        current_root = self.current_roots[self.current_idx]
+        for root, rows in targets.items():
+            words = self._words_for(root)
+            before = list(words)
+            words[:], new_rows = apply_edit(words, rows, edit, root)
+            if root == current_root:
+                selected = new_rows
+            if words != before:
+                batch.append((root, before, list(words)))
+        if len(batch) == 0:
+            return
+        self.undo_stack.append(batch)
+        self.redo_stack = []
+        if edit is delete_word:
+            # select the word that took the place of the first deleted one
+            selected = [min(targets[current_root][0], len(self.current_words) - 1)]
+        self._after_batch(batch, selected)
+
+    def _after_batch(self, batch, rows):
+        # one model update and one re-render for the whole batch
+        self._refresh_ls_words(rows)
         self._populate_text_view(self.current_idx)
+        if any(root != self.current_roots[self.current_idx] for root, _, _ in batch):
+            if self.ck_autosave.isChecked():
+                self.on_pb_save_clicked()
+            self._schedule_precompute()
+
+    def _refresh_ls_words(self, rows):
+        self.ls_words.setUpdatesEnabled(False)
+        self.ls_words.clear()
+        self.ls_words.addItems(self.current_words)
+        for row in rows:
+            if 0 <= row < self.ls_words.count():
+                self.ls_words.item(row).setSelected(True)
+        if rows and 0 <= rows[0] < self.ls_words.count():
+            self.ls_words.setCurrentRow(rows[0], QItemSelectionModel.Current)
+        self.ls_words.setUpdatesEnabled(True)
+
+    def _restore_batch(self, batch, which):
+        # which is 1 for the words before the batch, 2 for after
+        restored = []
+        for entry in batch:
+            words = self._words_for(entry[0])
+            if words is None:
+                continue
+            words[:] = entry[which]
+            restored.append(entry)
+        self._after_batch(restored, [])
+
+    def on_pb_undo_released(self):
+        if len(self.undo_stack) == 0:
+            return
+        batch = self.undo_stack.pop()
+        self.redo_stack.append(batch)
+        self._restore_batch(batch, 1)
+
+    def on_pb_redo_released(self):
+        if len(self.redo_stack) == 0:
+            return
+        batch = self.redo_stack.pop()
+        self.undo_stack.append(batch)
+        self._restore_batch(batch, 2)
+
+    def on_pb_delete_released(self):
+        self._apply_batch(delete_word)
     
     def on_pb_k_released(self):
-        # get selected word from the list if any
-        item = self.ls_words.selectedIndexes()
-        if len(item) == 0:
-            return
-        idx = item[0].row()
-        # add ك to the beginning of the word
-        word = self.current_words[idx]
-        word = "ك" + word
-        # update the word in the list
-        self.current_words[idx] = word
-        self.ls_words.clear()
-        for word in self.current_words:
-            self.ls_words.addItem(word)
-        self.ls_words.setCurrentRow(idx) 
+        self._apply_batch(add_prefix("ك"))
         
     def on_pb_b_released(self):
-        # get selected word from the list if any
-        item = self.ls_words.selectedIndexes()
-        if len(item) == 0:
-            return
-        idx = item[0].row()
-        # add ب to the beginning of the word
-        word = self.current_words[idx]
-        word = "ب" + word
-        # update the word in the list
-        self.current_words[idx] = word
-        self.ls_words.clear()
-        for word in self.current_words:
-            self.ls_words.addItem(word)
-        self.ls_words.setCurrentRow(idx) 
+        self._apply_batch(add_prefix("ب"))
     
     def on_pb_f_released(self):
-        # get selected word from the list if any
-        item = self.ls_words.selectedIndexes()
-        if len(item) == 0:
-            return
-        idx = item[0].row()
-        # add ف to the beginning of the word
-        word = self.current_words[idx]
-        word = "ف" + word
-        # update the word in the list
-        self.current_words[idx] = word
-        self.ls_words.clear()
-        for word in self.current_words:
-            self.ls_words.addItem(word)
-        self.ls_words.setCurrentRow(idx) 
+        self._apply_batch(add_prefix("ف"))
     
     def on_pb_l_released(self):
-        # get selected word from the list if any
-        item = self.ls_words.selectedIndexes()
-        if len(item) == 0:
-            return
-        idx = item[0].row()
-        # add ل to the beginning of the word
-        word = self.current_words[idx]
-        word = "ل" + word
-        # update the word in the list
-        self.current_words[idx] = word
-        self.ls_words.clear()
-        for word in self.current_words:
-            self.ls_words.addItem(word)
-        self.ls_words.setCurrentRow(idx) 
+        self._apply_batch(add_prefix("ل"))
 
     def on_pb_w_released(self):
-        # get selected word from the list if any
-        item = self.ls_words.selectedIndexes()
-        if len(item) == 0:
-            return
-        idx = item[0].row()
-        # add و to the beginning of the word
-        word = self.current_words[idx]
-        word = "و" + word
-        # update the word in the list
-        self.current_words[idx] = word
-        self.ls_words.clear()
-        for word in self.current_words:
-            self.ls_words.addItem(word)
-        self.ls_words.setCurrentRow(idx) 
+        self._apply_batch(add_prefix("و"))
+
+    def on_pb_strip_released(self):
+        self._apply_batch(remove_prefix)
 
     def on_pb_u_released(self):
-        # get selected word from the list if any
-        item = self.ls_words.selectedIndexes()
-        if len(item) == 0:
-            return
-        idx = item[0].row()
-        # remove ل from the beginning of the word
-        word = self.current_words[idx]
-        # add َ to the first letter of the word
-        word = word[0] + "َ" + word[1:]
-        
-        # update the word in the list
-        self.current_words[idx] = word
-        self.ls_words.clear()
-        for word in self.current_words:
-            self.ls_words.addItem(word)
-        self.ls_words.setCurrentRow(idx) 
+        self._apply_batch(set_haraka("َ"))
 
     def on_pb_o_released(self):
-        # get selected word from the list if any
-        item = self.ls_words.selectedIndexes()
-        if len(item) == 0:
-            return
-        idx = item[0].row()
-        # remove ل from the beginning of the word
-        word = self.current_words[idx]
-        # add ُ to the first letter of the word
-        word = word[0] + "ُ" + word[1:]
-        # update the word in the list
-        self.current_words[idx] = word
-        self.ls_words.clear()
-        for word in self.current_words:
-            self.ls_words.addItem(word)
-        self.ls_words.setCurrentRow(idx) 
+        self._apply_batch(set_haraka("ُ"))
 
     def on_pb_d_released(self):
-        # get selected word from the list if any
-        item = self.ls_words.selectedIndexes()
-        if len(item) == 0:
-            return
-        idx = item[0].row()
-        # remove ل from the beginning of the word
-        word = self.current_words[idx]
-        word = word[0] + "ِ" + word[1:]
-        # update the word in the list
-        self.current_words[idx] = word
-        self.ls_words.clear()
-        for word in self.current_words:
-            self.ls_words.addItem(word)
-        self.ls_words.setCurrentRow(idx) 
+        self._apply_batch(set_haraka("ِ"))
 
     def on_pb_reset_released(self):
         # this function reset words for the current root to the context words
@@ -723,6 +813,7 @@ class Ui_KM(QUi_KM, Ui_Ui_KM):
             self.ls_roots.addItem(item+" "+ str(len(self.resources[self.mojam][item].split())))
         with open("audio/not_yet.json","w") as f:
             json.dump({"data":not_yet},f,indent=4,ensure_ascii=False)
+        self.on_root_filter_changed()
         self.from_save = True
         self.current_idx = 0
         self.ls_roots.setCurrentRow(0)
@@ -744,6 +835,7 @@ class Ui_KM(QUi_KM, Ui_Ui_KM):
         # populate the list view
         for i, item in enumerate(self.current_roots):
             self.ls_roots.addItem(item)
+        self.on_root_filter_changed()
         self.from_save = True
         self.current_idx = 0
         self.ls_roots.setCurrentRow(0)
@@ -754,6 +846,12 @@ class Ui_KM(QUi_KM, Ui_Ui_KM):
             self.data = json.load(f)
             self.mojam_data = self.data[self.mojam]
             self.delegate.data = self.mojam_data
+        # the undo history refers to the words before the reload
+        self.undo_stack = []
+        self.redo_stack = []
+        # saved words may differ from what the upcoming roots were built with
+        self.precomputer.invalidate()
+        self._schedule_precompute()
 
 if __name__ == '__main__':
     
@@ -770,5 +868,6 @@ if __name__ == '__main__':
     app.setStyleSheet(light_style)
  
     form = Ui_KM(resources_file,dataset_file,"لسان العرب")
+    app.aboutToQuit.connect(form.precomputer.shutdown)
     form.show()
     sys.exit(app.exec_())
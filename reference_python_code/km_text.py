@@ -0,0 +1,172 @@
+"""
+Text helpers of km that don't need Qt, shared by km.py and the offline tools.
+"""
+import os
+import re
+import string
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ARABIC_PUNCTUATION = '،:؟؛«»'
+
+# All Arabic combining marks (tashkīl)
+DIACRITICS = r'\u0610-\u061A\u064B-\u0652\u06D6-\u06ED'
+
+# After each letter in your core word, we allow *any* number of diacritics
+COMBINING = rf'[{DIACRITICS}]*'
+
+# Define what our “word‐character” is, so our lookarounds treat diacritics as inside‐the‐word
+WORD_CHAR = rf'[\w{DIACRITICS}]'
+
+# The prefixes we’ll accept in front of your core – but never color unless
+# that prefix is actually part of your conjugation entry.
+_PREFIXES = ["لل", "و", "ب", "ل", "ف", "ك"]
+
+def strip_diacritics(s: str) -> str:
+    """Remove any tashkīl from your conjugation entry."""
+    return re.sub(rf'[{DIACRITICS}]', '', s)
+
+def highlight_conjugations(text: str, conjugations: list[str]) -> str:
+    # Sort longest→shortest so “كتاب” wins over “كتب”
+    for conj in sorted(conjugations, key=len, reverse=True):
+        # 1) Strip any diacritics the user provided, we’ll re‐allow them in matching
+        core_plain = strip_diacritics(conj)
+        if not core_plain:
+            continue
+
+        # 2) Build a diacritic‐tolerant regex for that core word
+        #    e.g. if core_plain = "به", this becomes "ب[ـ]*ه[ـ]*"
+        escaped = ''.join(re.escape(ch) + COMBINING for ch in core_plain)
+
+        # 3) Build a single regex with:
+        #    - custom "no word‐char" lookaround before
+        #    - an optional prefix group (we won't color this)
+        #    - the core group (we *will* color this)
+        #    - custom lookahead after
+        prefix_alt = '|'.join(re.escape(p) for p in _PREFIXES)
+        pattern = re.compile(
+            rf'(?<!{WORD_CHAR})'             # not preceded by letter/digit/underscore/diacritic
+            rf'(?P<prefix>(?:{prefix_alt}))?' # optional one of our prefixes
+            rf'(?P<core>{escaped})'           # the core word, with diacritics allowed
+            rf'(?!{WORD_CHAR})',              # not followed by letter/digit/underscore/diacritic
+            flags=re.UNICODE
+        )
+
+        # 4) Replace each match by re-inserting prefix un‐touched, coloring only core
+        def _repl(m):
+            pre  = m.group('prefix') or ''
+            cor  = m.group('core')
+            return f"{pre}<span style='color:#66d855'>{cor}</span>"
+
+        text = pattern.sub(_repl, text)
+
+    return text
+
+def split_by_period(text):
+    """
+    Splits text by periods except those within parentheses.
+    
+    Args:
+        text (str): Input text to be split
+        
+    Returns:
+        list: List of sentences, with whitespace stripped
+    """
+    results = []
+    current_sentence = ""
+    paren_count = 0
+    
+    for char in text:
+        current_sentence += char
+        
+        if char == '(':
+            paren_count += 1
+        elif char == ')':
+            paren_count = max(0, paren_count - 1)  # Prevent negative count
+        elif char == '.' and paren_count == 0:
+            # Only split if we're not inside parentheses
+            results.append(current_sentence.strip())
+            current_sentence = ""
+            
+    # Add the last sentence if it doesn't end with a period
+    if current_sentence.strip():
+        results.append(current_sentence.strip())
+        
+    return results
+
+def strip_prefix(w, root):
+    """
+    Removes one ك ب ل ف و prefix from w, unless the root itself starts with
+    that letter. A doubled و loses one when the root starts with و.
+    """
+    if w.startswith("ك") and not root.startswith("ك"):
+        w = w[1:]
+    elif w.startswith("ب") and not root.startswith("ب"):
+        w = w[1:]
+    elif w.startswith("ل") and not root.startswith("ل"):
+        w = w[1:]
+    elif w.startswith("ف") and not root.startswith("ف"):
+        w = w[1:]
+    elif w.startswith("و") and not root.startswith("و"):
+        w = w[1:]
+    elif w.startswith("وو") and root.startswith("و"):
+        w = w[1:]
+    return w
+
+def get_words(context, root):
+    similar_words = []
+    root = root.replace("أ","ء").replace("ئ","ء").replace("ؤ","ء").replace("إ","ء")
+    root_no_tashkeel = "".join([c for c in root if c.isalpha()])
+    # if root ends with 2 same letters, find that letter
+    if root[-1] == root[-2]:
+        shaddah_letter = root[-1]
+    else:
+        shaddah_letter = None
+    for act_word in context.split():
+        act_word = act_word.translate(str.maketrans('', '', string.punctuation+ARABIC_PUNCTUATION))
+        w_no_tashkeel = "".join([c for c in act_word if c.isalpha()])
+        w_no_tashkeel = w_no_tashkeel.replace("أ","ء").replace("ئ","ء").replace("ؤ","ء").replace("إ","ء")
+        w_no_tashkeel = w_no_tashkeel.replace("ا","ايو").replace("ي","ايو").replace("و","ايو")
+        if shaddah_letter:
+            w_no_tashkeel = w_no_tashkeel.replace(shaddah_letter,shaddah_letter+shaddah_letter)
+            
+        i = 0
+        j = 0
+        good = False
+        while i < len(root_no_tashkeel) and j < len(w_no_tashkeel):
+
+            if root_no_tashkeel[i] == 'ا':
+                i += 1
+            elif root_no_tashkeel[i] == w_no_tashkeel[j]:
+                i += 1
+                j += 1
+            else:
+                j += 1
+            if i == len(root_no_tashkeel):
+                good = True
+                break
+        if good:
+            similar_words.append(act_word)
+            # if not root.startswith("ول") and w_no_tashkeel.startswith("وال"):
+            #     w_no_tashkeel = w_no_tashkeel[3:]
+            # elif w_no_tashkeel.startswith("ال"):
+            #     w_no_tashkeel = w_no_tashkeel[2:]
+            # elif root[0] != "و" and w_no_tashkeel.startswith("و"):
+            #     w_no_tashkeel = w_no_tashkeel[1:]
+    
+ 
+    
+    # remove ك ب ل ف from the begginging if the root doesn't start with either
+    for i,w in enumerate(similar_words):
+        w = strip_prefix(w, root)
+        similar_words[i] = w
+        # check if word starts with haraka or not
+        if w.startswith("َ") or w.startswith("ُ") or w.startswith("ِ") or w.startswith("ً") or w.startswith("ٌ") or w.startswith("ٍ"):
+            w = w[1:]
+            similar_words[i] = w
+            
+    return unique(similar_words)
+
+def unique(sequence):
+    seen = set()
+    return [x for x in sequence if not (x in seen or seen.add(x))]
@@ -0,0 +1,42 @@
+"""
+Memory-mapped PCM store shared by km.py and transcode_audio.py, no Qt needed.
+"""
+import os
+import json
+import mmap
+
+class PcmStore:
+    """
+    Raw PCM of every root in one memory-mapped file, written by
+    transcode_audio.py. The offset table lives in <path>.json and keeps the
+    source format of every root.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path + ".json") as f:
+            table = json.load(f)
+        self.roots = table["roots"]
+        self.file = open(path, "rb")
+        stat = os.fstat(self.file.fileno())
+        if (stat.st_size, stat.st_mtime_ns) != (table.get("size"), table.get("mtime_ns")):
+            # the table belongs to another run, e.g. caught halfway through a
+            # rebuild; its offsets would play garbage, fall back to the mp3s
+            print(f"{path} does not match its offset table, not using it.")
+            self.roots = {}
+        # mmap refuses empty files
+        if stat.st_size > 0 and self.roots:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.map = None
+            self.roots = {}
+
+    def __contains__(self, root):
+        return root in self.roots
+
+    def get(self, root):
+        entry = self.roots[root]
+        return memoryview(self.map)[entry["offset"]:entry["offset"] + entry["length"]]
+
+    def params(self, root):
+        """The simpleaudio parameters of root."""
+        return self.roots[root]["params"]
@@ -0,0 +1,216 @@
+import os
+import re
+import copy
+import sys
+import json
+import time
+import argparse
+import importlib
+from multiprocessing import Pool
+
+from km_text import BASE_DIR, get_words, highlight_conjugations, split_by_period
+
+REFERENCE = {
+    "get_words": get_words,
+    "highlight_conjugations": highlight_conjugations,
+    "split_by_period": split_by_period,
+}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare faster text engines with the reference ones")
+    parser.add_argument("--resources", type=str, default=f"{BASE_DIR}/assets/resources.json", help="Directory where the data is stored")
+    parser.add_argument("--dataset", type=str, default=f"{BASE_DIR}/assets/dataset.json", help="Saved words, used as conjugations when present")
+    parser.add_argument("--mojam", type=str, default="لسان العرب", help="Dictionary to run over")
+    parser.add_argument("--candidate", type=str, action="append", default=[],
+                        help="engine=module:function, e.g. get_words=fast_text:get_words. Can be repeated")
+    parser.add_argument("--output", type=str, default=f"{BASE_DIR}/shadow_report.json", help="Where to save the failing cases")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs of each side per input, the fastest one counts")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of parallel workers")
+    return parser.parse_args()
+
+def load_function(spec):
+    module_name, _, function_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+def call(function, call_args):
+    # an exception is an output too, both sides must raise the same one
+    try:
+        return function(*call_args)
+    except Exception as e:
+        return f"raise {type(e).__name__}: {e}"
+
+def run(function, args):
+    """Calls function on its own copy of args, returns (output, whether it changed the copy)."""
+    call_args = copy.deepcopy(args)
+    output = call(function, call_args)
+    return output, list(call_args) != list(args)
+
+def timed(function, args):
+    # copy outside the timing, a side that edits its input must not leak it
+    call_args = copy.deepcopy(args)
+    start = time.perf_counter()
+    call(function, call_args)
+    return time.perf_counter() - start
+
+def differs(reference, candidate, args):
+    """True if the outputs differ or the candidate edits its input in place."""
+    expected, _ = run(reference, args)
+    actual, mutated = run(candidate, args)
+    return expected != actual or mutated
+
+def compare(reference, candidate, args, repeat):
+    """
+    Returns both outputs, whether the candidate edited its input and the best
+    time of each side. An untimed first run warms up both (the re cache,
+    imports, ...), then the order alternates so neither side always runs on
+    state the other just left behind.
+    """
+    expected, _ = run(reference, args)
+    actual, mutated = run(candidate, args)
+    reference_time = candidate_time = float("inf")
+    for i in range(max(1, repeat)):
+        if i % 2 == 0:
+            reference_time = min(reference_time, timed(reference, args))
+            candidate_time = min(candidate_time, timed(candidate, args))
+        else:
+            candidate_time = min(candidate_time, timed(candidate, args))
+            reference_time = min(reference_time, timed(reference, args))
+    return expected, actual, mutated, reference_time, candidate_time
+
+def minimize(items, fails):
+    """Delta debugging: the smallest sublist of items for which fails() still holds."""
+    n = 2
+    while len(items) >= 2:
+        chunk = -(-len(items) // n)
+        subsets = [items[i:i + chunk] for i in range(0, len(items), chunk)]
+        reduced = False
+        for i, subset in enumerate(subsets):
+            complement = [x for j, other in enumerate(subsets) if j != i for x in other]
+            if fails(subset):
+                items, n, reduced = subset, 2, True
+                break
+            if fails(complement):
+                items, n, reduced = complement, max(n - 1, 2), True
+                break
+        if not reduced:
+            if n >= len(items):
+                break
+            n = min(len(items), n * 2)
+    return items
+
+def minimize_case(reference, candidate, args):
+    """Shrinks the text (and the conjugation list if any) while the case still fails."""
+    original = list(args)
+    args = list(args)
+
+    def fails(new_args):
+        return differs(reference, candidate, new_args)
+
+    # keep the whitespace as tokens, a mismatch may depend on it
+    tokens = minimize(re.split(r'(\s+)', args[0]), lambda t: fails(["".join(t)] + args[1:]))
+    args[0] = "".join(tokens)
+    if len(args) > 1 and isinstance(args[1], list):
+        args[1] = minimize(args[1], lambda c: fails([args[0], c] + args[2:]))
+    # only report an input that still fails
+    if not fails(args):
+        return original
+    return args
+
+def root_cases(root, context, saved_words):
+    words = saved_words if saved_words is not None else call(get_words, (context, root))
+    if not isinstance(words, list):
+        words = []
+    yield "get_words", (context, root)
+    yield "highlight_conjugations", (context, words)
+    # the aligner and the seek lookup split the raw entry
+    yield "split_by_period", (context,)
+    # the view splits the highlighted text
+    yield "split_by_period", (call(highlight_conjugations, (context, words)),)
+
+_candidates = {}
+
+def check_root(job):
+    root, context, saved_words, specs, repeat = job
+    for engine, spec in specs.items():
+        if engine not in _candidates:
+            _candidates[engine] = load_function(spec)
+
+    records = []
+    for engine, args in root_cases(root, context, saved_words):
+        if engine not in specs:
+            continue
+        reference, candidate = REFERENCE[engine], _candidates[engine]
+        expected, actual, mutated, reference_time, candidate_time = compare(reference, candidate, args, repeat)
+        record = {
+            "root": root,
+            "engine": engine,
+            "reference_time": reference_time,
+            "candidate_time": candidate_time,
+        }
+        if expected != actual or mutated:
+            small = minimize_case(reference, candidate, args)
+            expected, _ = run(reference, small)
+            actual, mutated = run(candidate, small)
+            record["failure"] = {
+                "input": small,
+                "expected": expected,
+                "actual": actual,
+                "mutates_input": mutated,
+            }
+        records.append(record)
+    return records
+
+def main():
+    args = parse_args()
+    specs = {}
+    for candidate in args.candidate:
+        engine, _, spec = candidate.partition("=")
+        if engine not in REFERENCE:
+            sys.exit(f"Unknown engine {engine}, expected one of {', '.join(REFERENCE)}")
+        if ":" not in spec:
+            sys.exit(f"Bad candidate {candidate}, expected engine=module:function")
+        # fail here rather than inside every pool worker
+        try:
+            load_function(spec)
+        except (ImportError, AttributeError) as e:
+            sys.exit(f"Cannot load {spec}: {e}")
+        specs[engine] = spec
+    if len(specs) == 0:
+        # no candidates: check the runner itself, every engine against its own reference
+        specs = {engine: f"km_text:{engine}" for engine in REFERENCE}
+
+    with open(args.resources) as f:
+        resources = json.load(f)[args.mojam]
+    mojam_data = {}
+    if os.path.exists(args.dataset):
+        with open(args.dataset) as f:
+            mojam_data = json.load(f).get(args.mojam, {})
+
+    jobs = [(root, context, mojam_data.get(root), specs, args.repeat) for root, context in resources.items()]
+    totals = {engine: {"cases": 0, "failures": 0, "reference_time": 0.0, "candidate_time": 0.0} for engine in specs}
+    failures = []
+    with Pool(args.workers) as pool:
+        for records in pool.imap_unordered(check_root, jobs, chunksize=16):
+            for record in records:
+                total = totals[record["engine"]]
+                total["cases"] += 1
+                total["reference_time"] += record["reference_time"]
+                total["candidate_time"] += record["candidate_time"]
+                if "failure" in record:
+                    total["failures"] += 1
+                    failures.append(record)
+
+    for engine, total in totals.items():
+        speedup = total["reference_time"] / max(total["candidate_time"], 1e-9)
+        print(f"{engine:<24} cases: {total['cases']:<7} failures: {total['failures']:<5} "
+              f"reference: {total['reference_time']:.2f}s candidate: {total['candidate_time']:.2f}s speedup: {speedup:.2f}x")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"totals": totals, "failures": failures}, f, ensure_ascii=False, indent=4)
+    print(f"Report saved to {args.output}")
+
+    if failures:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
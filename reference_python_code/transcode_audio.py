@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import argparse
+from multiprocessing import Pool
+
+from pydub import AudioSegment
+
+from km_text import BASE_DIR
+from pcm_store import PcmStore
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Transcode the audio library into one memory-mapped PCM store")
+    parser.add_argument("--audio", type=str, default=f"{BASE_DIR}/audio/processed", help="Directory with <root>.mp3 files")
+    parser.add_argument("--output", type=str, default=f"{BASE_DIR}/audio/processed.pcm", help="Where to save the store, the offset table goes next to it")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of parallel workers")
+    return parser.parse_args()
+
+def transcode(job):
+    """Returns (root, raw data, params, decode seconds, error), one bad file must not stop the run."""
+    root, file_path = job
+    start = time.perf_counter()
+    try:
+        # keep the source format, playback must sound the same as from the mp3
+        audio = AudioSegment.from_file(file_path, format="mp3")
+    except Exception as e:
+        return root, None, None, 0, f"{type(e).__name__}: {e}"
+    params = {
+        'num_channels': audio.channels,
+        'bytes_per_sample': audio.sample_width,
+        'sample_rate': audio.frame_rate
+    }
+    return root, audio.raw_data, params, time.perf_counter() - start, None
+
+def drop_page_cache(path):
+    """Evicts path from the OS page cache where possible, returns True if it did."""
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+    return True
+
+def report(path, mp3_bytes, decode_seconds):
+    store_bytes = os.path.getsize(path)
+    # the store was just written and is still cached, reading that would flatter it
+    cold = drop_page_cache(path)
+    store = PcmStore(path)
+    start = time.perf_counter()
+    for root in store.roots:
+        # touch every page, playback reads the whole root
+        bytes(store.get(root))
+    map_seconds = time.perf_counter() - start
+    n = max(1, len(store.roots))
+
+    print(f"mp3 files:  {mp3_bytes / 2**20:.1f} MB")
+    print(f"pcm store:  {store_bytes / 2**20:.1f} MB ({store_bytes / max(1, mp3_bytes):.1f}x)")
+    print(f"decode:     {decode_seconds / n * 1000:.1f} ms per root")
+    if cold:
+        print(f"mapped:     {map_seconds / n * 1000:.2f} ms per root (cold store)")
+    else:
+        print(f"mapped:     {map_seconds / n * 1000:.2f} ms per root (warm: the store is still in the OS cache, cold reads are slower)")
+    print(f"saved:      {(decode_seconds - map_seconds) / n * 1000:.1f} ms per root")
+
+def remove(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+def main():
+    args = parse_args()
+    jobs = []
+    for name in sorted(os.listdir(args.audio)):
+        if not name.endswith(".mp3"):
+            continue
+        file_path = os.path.join(args.audio, name)
+        jobs.append((name[:-len(".mp3")], file_path))
+    if len(jobs) == 0:
+        print(f"No mp3 files in {args.audio}.")
+        return
+
+    # write next to the old store and swap at the end, the app may have it mapped
+    tmp_path = args.output + ".tmp"
+    roots = {}
+    skipped = {}
+    offset = 0
+    decode_seconds = 0
+    try:
+        with open(tmp_path, "wb") as f, Pool(args.workers) as pool:
+            for root, raw_data, params, seconds, error in pool.imap_unordered(transcode, jobs, chunksize=4):
+                if error is not None:
+                    skipped[root] = error
+                    continue
+                f.write(raw_data)
+                roots[root] = {"offset": offset, "length": len(raw_data), "params": params}
+                offset += len(raw_data)
+                decode_seconds += seconds
+
+        # the two files are replaced one after the other, PcmStore uses the
+        # size and mtime (kept by os.replace) to spot a table of another run
+        stat = os.stat(tmp_path)
+        table = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "roots": roots}
+        with open(tmp_path + ".json", "w", encoding="utf-8") as f:
+            json.dump(table, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, args.output)
+        os.replace(tmp_path + ".json", args.output + ".json")
+    except BaseException:
+        remove(tmp_path)
+        remove(tmp_path + ".json")
+        raise
+
+    print(f"Transcoded {len(roots)}/{len(jobs)} roots -> {args.output}")
+    if skipped:
+        print(f"Skipped {len(skipped)} roots:")
+        for root, error in sorted(skipped.items()):
+            print(f"  {root}: {error}")
+
+    if roots:
+        # compare against the mp3s that made it into the store
+        mp3_bytes = sum(os.path.getsize(file_path) for root, file_path in jobs if root in roots)
+        report(args.output, mp3_bytes, decode_seconds)
+
+if __name__ == '__main__':
+    main()